@@ -1,5 +1,7 @@
+import os
 import sys
-from queue import SimpleQueue
+import functools
+from collections import deque
 import re
 from typing import Tuple, List, Optional
 
@@ -19,8 +21,37 @@ from ayon_core.pipeline import get_current_context
 import ayon_core.lib
 import ayon_api
 
+try:
+    from ayon_core.pipeline.template_data import construct_folder_full_name
+except ImportError:
+    # couldn't load the rvx custom core function
+    construct_folder_full_name = None
+
 log = Logger.get_logger('ayon_gaffer.api.lib')
 
+# Plug flags used when creating and inspecting plugs
+DYNAMIC_PLUG_FLAGS = Gaffer.Plug.Flags.Default | Gaffer.Plug.Flags.Dynamic
+_SERIALISABLE = Gaffer.Plug.Flags.Serialisable
+
+# Pattern used by `get_next_valid_name`
+_NAME_TEMPLATE_RE = re.compile(r'([a-zA-Z0-9_]*)(#+)([a-zA-Z0-9_]*)')
+
+
+def to_forward_slashes(path) -> str:
+    """Return `path` as string with forward slashes as separators.
+
+    Args:
+        path (Union[str, os.PathLike]): The path to convert.
+
+    Returns:
+        str: The path using forward slashes only.
+
+    """
+    path = os.fspath(path)
+    if "\\" in path:
+        path = path.replace("\\", "/")
+    return path
+
 
 def set_node_color(node: Gaffer.Node, color: Tuple[float, float, float]):
     """Set node color.
@@ -38,18 +69,42 @@ def set_node_color(node: Gaffer.Node, color: Tuple[float, float, float]):
                                   imath.Color3f(*color))
 
 
-def set_node_color_from_settings(node: Gaffer.Node, product_type: str):
-    project_name = get_current_context()["project_name"]
+@functools.lru_cache(maxsize=8)
+def _product_color_map(project_name: str) -> dict:
+    """Return product type to node color mapping from project settings.
+
+    The result is cached per project name, call
+    `clear_product_color_cache` to pick up changed settings.
+
+    Args:
+        project_name (str): The project to get the settings for.
+
+    Returns:
+        dict: Lowercase product type to RGB color tuple.
+
+    """
     settings = get_project_settings(project_name)
     load_settings = settings.get("gaffer", {}).get("load", {})
     col_list = load_settings.get("product_colors", {}).get("color_list", [])
-
+    colors = {}
     for entry in col_list:
-        print("!!!!", entry)
-        if product_type.lower() == entry["name"].lower():
-            set_node_color(node, entry["color"][:3])
-            return
-    log.warning(f"No color selected for product type: [{product_type}]")
+        # First matching entry wins
+        colors.setdefault(entry["name"].lower(), tuple(entry["color"][:3]))
+    return colors
+
+
+def clear_product_color_cache():
+    """Clear the cached product colors, e.g. after a context change."""
+    _product_color_map.cache_clear()
+
+
+def set_node_color_from_settings(node: Gaffer.Node, product_type: str):
+    project_name = get_current_context()["project_name"]
+    color = _product_color_map(project_name).get(product_type.lower())
+    if color is None:
+        log.warning(f"No color selected for product type: [{product_type}]")
+        return
+    set_node_color(node, color)
 
 
 def make_box(name: str,
@@ -90,15 +145,15 @@ def make_box(name: str,
         box_in = Gaffer.BoxIn(f"BoxIn_{inp}")
         box.addChild(box_in)
         box_in.setup(GafferScene.ScenePlug('out'))
-        # set the newest plug name to the input name
-        box.children()[-1].setName(inp)
+        # set the newly promoted plug name to the input name
+        box_in.promotedPlug().setName(inp)
 
     for outp in outputs:
         box_out = Gaffer.BoxOut(f"BoxOut_{outp}")
 
         box.addChild(box_out)
         box_out.setup(GafferScene.ScenePlug("in",))
-        box.children()[-1].setName(outp)
+        box_out.promotedPlug().setName(outp)
 
     if hide_add_buttons:
         for key in [
@@ -158,7 +213,7 @@ def make_scene_load_box(
     filename_plug = Gaffer.StringPlug(
         "fileName",
         defaultValue="",
-        flags=Gaffer.Plug.Flags.Default | Gaffer.Plug.Flags.Dynamic,
+        flags=DYNAMIC_PLUG_FLAGS,
     )
     Gaffer.Metadata.registerValue(filename_plug, "nodule:type", "")
     box.addChild(filename_plug)
@@ -173,7 +228,8 @@ def make_scene_load_box(
     else:
         sc_root_name = scenegraph_template
         sub_groups = []
-    print(f"scenegraph template root {sc_root_name}, sub groups: {sub_groups}")
+    log.debug("scenegraph template root %s, sub groups: %s",
+              sc_root_name, sub_groups)
 
     group_nodes = create_sub_groups(box, sub_groups)
     group_nodes.reverse()
@@ -190,7 +246,6 @@ def make_scene_load_box(
             group["in"][0].setInput(current_group["out"])
             current_group = group
     else:
-        print("*****")
         current_group = scene_reader
 
     merge_scenes = GafferScene.MergeScenes()
@@ -245,7 +300,6 @@ def create_sub_groups(parent, sub_groups):
     '''
     group_nodes = []
     for idx, grp in enumerate(sub_groups):
-        print(f"** {grp} **")
         subs = "/".join(sub_groups[0:idx])
         if subs != "":
             subs = f"/{subs}"
@@ -254,7 +308,7 @@ def create_sub_groups(parent, sub_groups):
         plug = Gaffer.BoolPlug(
             plug_name,
             defaultValue=True,
-            flags=Gaffer.Plug.Flags.Default | Gaffer.Plug.Flags.Dynamic,
+            flags=DYNAMIC_PLUG_FLAGS,
         )
         parent.addChild(plug)
         Gaffer.Metadata.registerValue(plug, "nodule:type", "")
@@ -285,9 +339,8 @@ def get_next_valid_name(template, script_node):
         template (str): The template string to format.
         script_node (Gaffer.ScriptNode): The script scriptNode
     """
-    res = re.search(r'([a-zA-Z0-9_]*)(#+)([a-zA-Z0-9_]*)', template)
+    res = _NAME_TEMPLATE_RE.search(template)
     if res is not None:
-        print(res.group(1), res.group(2), res.group(3))
         head = res.group(1)
         padding = res.group(2)
         tail = res.group(3)
@@ -299,20 +352,14 @@ def get_next_valid_name(template, script_node):
 
     if padding:
         pad_len = len(padding)
-        ex_names = []
+        # Find the highest number of existing nodes in a single pass
+        highest_number = 0
+        name_re = re.compile(rf"{re.escape(head)}(\d+){re.escape(tail)}$")
         for child in script_node.children():
-            if re.match(f"{head}.*{tail}", child.getName()):
-                ex_names.append(child.getName())
-        ex_names.sort(reverse=True)
-        if len(ex_names) == 0:
-            next_number = 1
-        else:
-            last_name = ex_names[0]
-
-            res = re.search(r'(.*)_*(\d+)(.*)', last_name)
+            res = name_re.match(child.getName())
             if res is not None:
-                next_number = int(res.group(2)) + 1
-        new_number = str(next_number).zfill(pad_len)
+                highest_number = max(highest_number, int(res.group(1)))
+        new_number = str(highest_number + 1).zfill(pad_len)
 
     return f"{head}{new_number}{tail}"
 
@@ -359,15 +406,16 @@ def traverse_scene(scene_plug: GafferScene.ScenePlug,
         str: Child path
 
     """
-    queue = SimpleQueue()
-    queue.put_nowait(root)
-    while not queue.empty():
-        path = queue.get_nowait()
+    child_names = scene_plug.childNames
+    queue = deque((root,))
+    enqueue = queue.extend
+    while queue:
+        path = queue.popleft()
         yield path
 
-        for child_name in scene_plug.childNames(path):
-            child_path = f"{path.rstrip('/')}/{child_name}"
-            queue.put_nowait(child_path)
+        # Only the root can end with a separator, child paths never do
+        prefix = path if path.endswith("/") else f"{path}/"
+        enqueue(prefix + str(name) for name in child_names(path))
 
 
 def find_camera_paths(scene_plug: GafferScene.ScenePlug,
@@ -409,19 +457,30 @@ def find_paths_by_type(scene_plug: GafferScene.ScenePlug,
         List[str]: List of found paths matching the object type name.
 
     """
-    result = []
-    for path in traverse_scene(scene_plug, root):
-        if scene_plug.object(path).typeName() == object_type_name:
-            result.append(path)
-    return result
+    if hasattr(GafferScene.SceneAlgo, "findAll"):
+        # Let Gaffer traverse the scene in parallel natively, the predicate
+        # is evaluated with `scene:path` set to the visited location.
+        def predicate(scene, path):
+            return scene["object"].getValue().typeName() == object_type_name
+
+        paths = GafferScene.SceneAlgo.findAll(scene_plug, predicate, root)
+        return paths.paths()
+
+    # Fall back to traversing the scene in Python for older Gaffer versions
+    get_object = scene_plug.object
+    return [
+        path for path in traverse_scene(scene_plug, root)
+        if get_object(path).typeName() == object_type_name
+    ]
 
 
 def get_color_management_preferences(script_node):
     """Get default OCIO preferences"""
+    ocio = script_node['openColorIO']
     return {
-        "config": script_node['openColorIO']['config'].getValue(),
-        "display": script_node['openColorIO']['displayTransform'].getValue(),
-        "view": script_node['openColorIO']['workingSpace'].getValue()
+        "config": ocio['config'].getValue(),
+        "display": ocio['displayTransform'].getValue(),
+        "view": ocio['workingSpace'].getValue()
     }
 
 
@@ -457,7 +516,7 @@ def replace_node(old_node, new_node, ignore_plug_names=[], rename=True):
         if plug.getName() in ignore_plug_names:
             continue
 
-        if not bool(plug.getFlags() & Gaffer.Plug.Flags.Serialisable):
+        if not plug.getFlags() & _SERIALISABLE:
             log.debug(f"Throwing out non-serializable {plug.getName()}")
             continue
         try:
@@ -483,9 +542,9 @@ def replace_node(old_node, new_node, ignore_plug_names=[], rename=True):
             for plug in pluginfo['out']:
                 plug.setInput(source_plug)
 
+        parent_cache = {}
         for plug, value in plug_data.items():
-            plug_relative_name = plug.fullName().replace(
-                plug.node().fullName(), "")[1:]  # strip out the prefix .
+            plug_relative_name = plug.relativeName(old_node)
 
             target_plug = new_node
             for part in plug_relative_name.split("."):
@@ -497,10 +556,9 @@ def replace_node(old_node, new_node, ignore_plug_names=[], rename=True):
 
             if target_plug is None:
                 # the target plug does not exist. we need to create it
-                copy_plug(plug, new_node)
+                copy_plug(plug, new_node, parent_cache)
             else:
-                if not bool(target_plug.getFlags() &
-                            Gaffer.Plug.Flags.Serialisable):
+                if not target_plug.getFlags() & _SERIALISABLE:
                     log.debug(f"Skipping non-serializable plug {target_plug}")
                     continue
                 try:
@@ -512,27 +570,44 @@ def replace_node(old_node, new_node, ignore_plug_names=[], rename=True):
         new_node.scriptNode().removeChild(old_node)
         new_node.setName(old_name)
         # and finally we have a hack to avoid `scene:path` errors on some
-        # upstream nodes after replacing a node
+        # upstream nodes after replacing a node. Toggling `enabled` dirties
+        # everything downstream of those nodes, including the outputs of
+        # `new_node`, so the viewers and hierarchy re-evaluate.
         for n in Gaffer.NodeAlgo.upstreamNodes(new_node):
             try:
                 before = n["enabled"].getValue()
-                n["enabled"].setValue(False)
-                n["enabled"].setValue(True)
+                n["enabled"].setValue(not before)
                 n["enabled"].setValue(before)
             except Exception:
                 pass
 
 
-def copy_plug(plug, destination_node):
+def copy_plug(plug, destination_node, parent_cache=None):
+    """Copy `plug` to the same relative location on `destination_node`.
+
+    Arguments:
+        plug (Gaffer.Plug): The plug to copy.
+        destination_node (Gaffer.Node): The node to add the copy to.
+        parent_cache (Optional[dict]): Resolved parent plugs on the
+            destination node by their relative path parts. Pass the same
+            dict when copying many plugs to the same node to avoid
+            resolving shared parents again.
+
+    """
     log.debug(f"Copying plug [{plug}] to {destination_node}")
     try:
         src_node = plug.node()
 
-        plug_path = plug.fullName().replace(src_node.fullName(), "").strip(".")
-        plug_parts = plug_path.split('.')[:-1]
-        new_plug_parent = destination_node
-        for part in plug_parts:
-            new_plug_parent = new_plug_parent[part]
+        plug_path = plug.relativeName(src_node)
+        plug_parts = tuple(plug_path.split('.')[:-1])
+        if parent_cache is not None and plug_parts in parent_cache:
+            new_plug_parent = parent_cache[plug_parts]
+        else:
+            new_plug_parent = destination_node
+            for part in plug_parts:
+                new_plug_parent = new_plug_parent[part]
+            if parent_cache is not None:
+                parent_cache[plug_parts] = new_plug_parent
 
         new_plug = type(plug)(
             plug.getName(),
@@ -552,30 +627,28 @@ def copy_plug(plug, destination_node):
 
 
 def get_all_plugs(in_node, thelist, include_non_serializable=True):
-    for plug in in_node.children(Gaffer.Plug):
+    stack = list(reversed(in_node.children(Gaffer.Plug)))
+    while stack:
+        plug = stack.pop()
         if (not include_non_serializable and
-                not bool(plug.getFlags() & Gaffer.Plug.Flags.Serialisable)):
+                not plug.getFlags() & _SERIALISABLE):
             continue
         thelist.append(plug)
-        if len(plug.children(Gaffer.Plug)) > 0:
-            get_all_plugs(plug, thelist, include_non_serializable)
+        stack.extend(reversed(plug.children(Gaffer.Plug)))
 
 
 def get_plug_tree(in_node, include_non_serializable=False):
     plugs = {}
-
-    def plug_traversal(in_node, plug_dict, include_non_serializable):
-        for plug in in_node.children(Gaffer.Plug):
-            if not include_non_serializable and not bool(plug.getFlags() & Gaffer.Plug.Flags.Serialisable):
+    stack = [(in_node, plugs)]
+    while stack:
+        parent, plug_dict = stack.pop()
+        for plug in parent.children(Gaffer.Plug):
+            if (not include_non_serializable and
+                    not plug.getFlags() & _SERIALISABLE):
                 continue
 
-            if plug not in plug_dict.keys():
-                plug_dict[plug] = {}
-
-            if len(plug.children(Gaffer.Plug)) > 0:
-                plug_traversal(plug, plug_dict[plug], include_non_serializable)
-
-    plug_traversal(in_node, plugs, include_non_serializable)
+            sub_dict = plug_dict[plug] = {}
+            stack.append((plug, sub_dict))
     return plugs
 
 
@@ -612,24 +685,26 @@ def get_node_connections(node, include_non_serializable=False):
 
     all_the_plugs = []
     get_all_plugs(node, all_the_plugs)
+    # plugs on `node` itself or on its children are internal connections,
+    # bind the check once since it runs for every connected plug
+    is_internal = node.isAncestorOf
     plugs = {}
     for plug in all_the_plugs:
+        if (not include_non_serializable and
+                not plug.getFlags() & _SERIALISABLE):
+            continue
+
         the_input = plug.getInput()
         outputs = plug.outputs()
-        if not include_non_serializable and not bool(plug.getFlags() & Gaffer.Plug.Flags.Serialisable):
+        if the_input is None and not outputs:
             continue
 
-        plugmap = {'in': [], 'out': []}
-        if the_input is not None:
-            if not node.isAncestorOf(the_input):
-                plugmap['in'].append(the_input)
-        for o in outputs:
-            if o.node() == node or node.isAncestorOf(o):
-                continue
-            plugmap['out'].append(o)
-        if the_input is None and len(outputs) == 0:
-            continue
-        if len(plugmap["in"]) == len(plugmap["out"]) == 0:
+        plugmap = {
+            'in': [] if the_input is None or is_internal(the_input)
+            else [the_input],
+            'out': [o for o in outputs if not is_internal(o)]
+        }
+        if not plugmap["in"] and not plugmap["out"]:
             continue
         plugs[plug.relativeName(node)] = plugmap
     return plugs
@@ -641,53 +716,43 @@ def create_render_shot_plug():
         Gaffer.StringPlug(
             "value",
             defaultValue='',
-            flags=Gaffer.Plug.Flags.Default | Gaffer.Plug.Flags.Dynamic
+            flags=DYNAMIC_PLUG_FLAGS
         ),
         True,
         "render:shot",
-        Gaffer.Plug.Flags.Default | Gaffer.Plug.Flags.Dynamic)
+        DYNAMIC_PLUG_FLAGS)
     return render_shot_plug
 
 
 def create_multishot_context_vars(script_node):
     context_vars = script_node["variables"]
-    existing_variables = [var["name"].getValue()
-                          for var in context_vars.children()]
-    if "render:shot" not in existing_variables:
-        render_shot_plug = create_render_shot_plug()
-        context_vars.addChild(render_shot_plug)
+    for var in context_vars.children():
+        if var["name"].getValue() == "render:shot":
+            return
+
+    render_shot_plug = create_render_shot_plug()
+    context_vars.addChild(render_shot_plug)
 
 
 def node_name_from_template(template_string, context):
-    try:
-        from ayon_core.pipeline.template_data import (
-            construct_folder_full_name
-        )
-        use_full_name = True
-    except ModuleNotFoundError:
-        # couldn't load the rvx custom core function
-        use_full_name = False
     folder_entity = context["folder"]
-    product_name = context["product"]["name"]
-    folder_entity = context["folder"]
-    hierarchy_parts = folder_entity["path"].split("/")
-    hierarchy_parts.pop(0)
-    hierarchy_parts.pop(-1)
-    if use_full_name:
+    product_entity = context["product"]
+    folder_name = folder_entity["name"]
+    # strip the empty leading part and the folder itself
+    hierarchy_parts = folder_entity["path"].split("/")[1:-1]
+    if construct_folder_full_name is not None:
         full_name = construct_folder_full_name(
             context["project"]["name"], folder_entity, hierarchy_parts)
     else:
-        full_name = folder_entity["name"]
-    product_entity = context["product"]
+        full_name = folder_name
     product_name = product_entity["name"]
     product_type = product_entity["productType"]
-    repre_entity = context["representation"]
-    repre_cont = repre_entity["context"]
+    repre_cont = context["representation"]["context"]
     formatting_data = {
-        "asset_name": folder_entity["name"],
+        "asset_name": folder_name,
         "asset_type": "asset",
         "folder": {
-            "name": folder_entity["name"],
+            "name": folder_name,
             "fullname": full_name,
         },
         "subset": product_name,
@@ -710,22 +775,18 @@ def append_to_csv_plug(plug, value_to_add, allow_duplicates=False):
     '''
 
     current_value = plug.getValue()
-    value_list = current_value.split(',')
-    if allow_duplicates:
-        value_list.append(value_to_add)
-    else:
-        if value_to_add not in value_list:
-            value_list.append(value_to_add)
-    plug.setValue(",".join(value_list))
+    if not current_value:
+        plug.setValue(value_to_add)
+        return
+
+    # wrap in delimiters so only whole entries are matched
+    if not allow_duplicates and f",{value_to_add}," in f",{current_value},":
+        return
+    plug.setValue(f"{current_value},{value_to_add}")
 
 
 def traverse_nodegraph(root_node: Gaffer.Node, result: list):
-    children = root_node.children(Gaffer.Node)
-    if len(children) == 0:
-        return
-    for child in children:
-        result.append(child)
-        traverse_nodegraph(child, result)
+    result.extend(get_all_children(root_node))
 
 
 def get_all_children(root_node: Gaffer.Node):
@@ -733,7 +794,17 @@ def get_all_children(root_node: Gaffer.Node):
     Return a list of all the nodes that are children of `root_node` so if
     the script node is passed return all nodes in the script.
 
+    The nodes are returned depth first, each node directly followed by its
+    own children. This traverses down without the need for a recursive
+    function.
+
     """
     all_nodes = []
-    traverse_nodegraph(root_node, all_nodes)
+    stack = list(reversed(root_node.children(Gaffer.Node)))
+    while stack:
+        node = stack.pop()
+        all_nodes.append(node)
+        children = node.children(Gaffer.Node)
+        if children:
+            stack.extend(reversed(children))
     return all_nodes
@@ -3,16 +3,16 @@
 import os
 import sys
 import json
+import weakref
+from typing import Optional
 
 import Gaffer  # noqa
-import GafferUI.FileMenu
 
 from ayon_core.host import HostBase, IWorkfileHost, ILoadHost, IPublishHost
 from ayon_gaffer.api.nodes import RenderLayerNode
 
-import pyblish.api
-
 from ayon_core.pipeline import (
+    registered_host,
     register_creator_plugin_path,
     register_loader_plugin_path,
     AVALON_CONTAINER_ID,
@@ -39,6 +39,22 @@ self.root = None
 
 # A prefix used for storing JSON blobs in string plugs
 JSON_PREFIX = "JSON:::"
+# Compact separators for JSON blobs stored in string plugs
+_JSON_SEPARATORS = (",", ":")
+
+# User data keys and ids identifying a loaded container
+_CONTAINER_KEYS = (
+    "schema", "id", "name", "namespace", "representation", "loader"
+)
+_CONTAINER_IDS = frozenset({AYON_CONTAINER_ID, AVALON_CONTAINER_ID})
+
+# Plug types used for imprinted user data
+_PLUG_TYPES = {
+    str: Gaffer.StringPlug,
+    bool: Gaffer.BoolPlug,
+    float: Gaffer.FloatPlug,
+    int: Gaffer.IntPlug,
+}
 
 
 def set_root(root: Gaffer.ScriptNode):
@@ -57,8 +73,20 @@ class GafferHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
     def __init__(self, application):
         super(GafferHost, self).__init__()
         self.application = application
+        self._installed = False
+        # Containers per script node, see `_get_script_containers`
+        self._containers = weakref.WeakKeyDictionary()
+        # Last read context data as (raw JSON string, parsed data)
+        self._context_data_cache = (None, None)
+        # Scripts `_on_scene_new` already ran for
+        self._initialized_scripts = weakref.WeakSet()
 
     def install(self):
+        if self._installed:
+            return
+
+        import pyblish.api
+
         pyblish.api.register_host("gaffer")
 
         pyblish.api.register_plugin_path(PUBLISH_PATH)
@@ -70,6 +98,7 @@ class GafferHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
         log.info(CREATE_PATH)
 
         self._register_callbacks()
+        self._installed = True
 
     def has_unsaved_changes(self):
         script = get_root()
@@ -88,12 +117,10 @@ class GafferHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
         if not dst_path:
             dst_path = self.get_current_workfile()
 
-        dst_path = dst_path.replace("\\", "/")
-        dst_path = dst_path.replace(os.sep, "/")
+        dst_path = ayon_gaffer.api.lib.to_forward_slashes(dst_path)
 
         script = get_root()
         script.serialiseToFile(dst_path)
-        dst_path = dst_path.replace("\\", "/").replace(os.sep, "/")
 
         script["fileName"].setValue(dst_path)
         script["unsavedChanges"].setValue(False)
@@ -108,11 +135,13 @@ class GafferHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
         return dst_path
 
     def open_workfile(self, filepath):
-        filepath = filepath.replace("\\", "/").replace(os.sep, "/")
+        filepath = ayon_gaffer.api.lib.to_forward_slashes(filepath)
 
         if not os.path.exists(filepath):
             raise RuntimeError("File does not exist: {}".format(filepath))
 
+        import GafferUI.FileMenu
+
         script = get_root()
         script_window = GafferUI.ScriptWindow.acquire(script)
 
@@ -131,46 +160,131 @@ class GafferHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
 
     def get_containers(self):
         script = get_root()
+        containers = self._get_script_containers(script)
+        for node, (data, _connection) in list(containers.items()):
+            container = dict(data)
+            container["objectName"] = node.fullName()
+            container["_node"] = node
+
+            yield container
+
+    def register_container(self, node: Gaffer.Node):
+        """Update the cached container data of `node`.
+
+        This needs to be called whenever a node is imprinted as container
+        after it was added to the script, see `imprint_container`.
+
+        """
+        parent = node.parent()
+        if parent is None:
+            # Not part of a script yet, picked up once it is added
+            return
+
+        containers = self._containers.get(parent)
+        if containers is not None:
+            self._update_container(containers, node)
 
-        required = [
-            "schema", "id", "name", "namespace", "representation", "loader"
-        ]
+    def _get_script_containers(self, script: Gaffer.ScriptNode) -> dict:
+        """Return the cached containers of a script.
 
+        The containers are collected by scanning the script's children.
+        The result is kept until a node is added to the script, since
+        pasted, duplicated or imported nodes only get their user plugs
+        after they were added. Removed nodes are dropped from the cache
+        and the plug set signal of each container node keeps its data
+        up to date.
+
+        Returns:
+            dict: Per container node a tuple of its container data and
+                the connection to its plug set signal.
+
+        """
+        if script not in self._containers:
+            script.childAddedSignal().connect(
+                self._on_container_node_added, scoped=False)
+            script.childRemovedSignal().connect(
+                self._on_container_node_removed, scoped=False)
+        else:
+            containers = self._containers[script]
+            if containers is not None:
+                return containers
+
+        containers = {}
         for node in script.children(Gaffer.Node):
-            if "user" not in node:
-                # No user attributes
-                continue
+            self._update_container(containers, node)
+        self._containers[script] = containers
 
-            user = node["user"]
-            if any(key not in user for key in required):
-                continue
+        return containers
 
-            if user["id"].getValue() not in {AYON_CONTAINER_ID, AVALON_CONTAINER_ID}:
-                continue
-            container = {
-                key: user[key].getValue() for key in required
-            }
-            container["objectName"] = node.fullName()
-            container["_node"] = node
+    def _update_container(self, containers: dict, node: Gaffer.Node):
+        data = _get_container_data(node)
+        if data is None:
+            # Removing the entry also disconnects the plug set signal
+            containers.pop(node, None)
+            return
 
-            yield container
+        if node in containers:
+            connection = containers[node][1]
+        else:
+            connection = node.plugSetSignal().connect(
+                self._on_container_plug_set, scoped=True)
+        containers[node] = (data, connection)
+
+    def _on_container_node_added(self, script, node):
+        if isinstance(node, Gaffer.Node) and script in self._containers:
+            # Rescan on the next `get_containers` call
+            self._containers[script] = None
+
+    def _on_container_node_removed(self, script, node):
+        containers = self._containers.get(script)
+        if containers is not None:
+            containers.pop(node, None)
+
+    def _on_container_plug_set(self, plug):
+        node = plug.node()
+        if "user" in node and node["user"].isAncestorOf(plug):
+            self.register_container(node)
 
     def update_context_data(self, data, changes):
         """Store context data as single JSON blob in script's user data"""
         script = get_root()
-        data_str = json.dumps(data)
+        data_str = json.dumps(
+            data,
+            separators=_JSON_SEPARATORS,
+            sort_keys=True,
+            ensure_ascii=False
+        )
 
-        # Always override the full plug - even if it already exists
-        script["user"][self._context_plug] = Gaffer.StringPlug(
+        user = script["user"]
+        plug = user.getChild(self._context_plug)
+        if isinstance(plug, Gaffer.StringPlug):
+            # Update the existing plug, unless nothing changed
+            if plug.getValue() != data_str:
+                plug.setValue(data_str)
+            return
+
+        # Plug is missing or of an unexpected type, (re)create it
+        user[self._context_plug] = Gaffer.StringPlug(
             defaultValue=data_str,
-            flags=Gaffer.Plug.Flags.Default | Gaffer.Plug.Flags.Dynamic
+            flags=ayon_gaffer.api.lib.DYNAMIC_PLUG_FLAGS
         )
 
     def get_context_data(self):
+        """Return the context data stored on the current script.
+
+        The parsed data is cached for as long as the stored JSON does not
+        change, so the returned dict is shared between calls and must not
+        be modified in place.
+
+        """
         script = get_root()
         if "user" in script and self._context_plug in script["user"]:
             data_str = script["user"][self._context_plug].getValue()
-            return json.loads(data_str)
+            cached_str, cached_data = self._context_data_cache
+            if data_str != cached_str:
+                cached_data = json.loads(data_str)
+                self._context_data_cache = (data_str, cached_data)
+            return cached_data
         return {}
 
     def _register_callbacks(self):
@@ -199,6 +313,15 @@ class GafferHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
             pass
 
     def _on_scene_new(self, script_container, script_node):
+        # This is triggered by the scripts' childAddedSignal as well as
+        # manually from `open_workfile`, only initialize each script once
+        if script_node in self._initialized_scripts:
+            return
+        self._initialized_scripts.add(script_node)
+
+        # The context (and with that the project settings) may have changed
+        ayon_gaffer.api.lib.clear_product_color_cache()
+
         # Update the projectRootDirectory variable for new workfile scripts
         ayon_gaffer.api.lib.create_multishot_context_vars(script_node)
         log.debug(f'Adding childAddedSignal to {script_node}')
@@ -211,18 +334,21 @@ class GafferHost(HostBase, IWorkfileHost, ILoadHost, IPublishHost):
         # loaded we need to manually trigger the connect render layer
         # signal for the renderlayer nodes in the scene
         for node in script_node.children(RenderLayerNode):
-            self.connect_render_layer_signals(script_node, node)
+            self._connect_render_layer(node)
 
         ayon_gaffer.api.nodes.check_boxnode_versions(script_node)
 
     def connect_render_layer_signals(self, script_node, new_node):
         if isinstance(new_node, RenderLayerNode):
-            try:
-                new_node.connect_signals()
-                # new_node.update_outputs()
-            except Exception as err:
-                log.error(f"Could not connect signals for render layer"
-                          f"{new_node}: {err}")
+            self._connect_render_layer(new_node)
+
+    def _connect_render_layer(self, node: RenderLayerNode):
+        try:
+            node.connect_signals()
+            # node.update_outputs()
+        except Exception as err:
+            log.error(f"Could not connect signals for render layer"
+                      f"{node}: {err}")
 
 
 def imprint_container(node: Gaffer.Node,
@@ -257,6 +383,39 @@ def imprint_container(node: Gaffer.Node,
     }
     imprint(node, data)
 
+    host = registered_host()
+    if isinstance(host, GafferHost):
+        host.register_container(node)
+
+
+def _get_container_data(node: Gaffer.Node):
+    """Return the container data imprinted on `node`.
+
+    Returns:
+        Optional[dict]: The container data or None if the node is not
+            a container.
+
+    """
+    if "user" not in node:
+        # No user attributes
+        return None
+
+    user = node["user"]
+    # Check the id first so most non-container nodes are rejected early
+    id_plug = user.getChild("id")
+    if id_plug is None:
+        return None
+    container_id = id_plug.getValue()
+    if container_id not in _CONTAINER_IDS:
+        return None
+
+    # Resolve each plug once instead of a membership test plus a lookup
+    plugs = [user.getChild(key) for key in _CONTAINER_KEYS]
+    if any(plug is None for plug in plugs):
+        return None
+
+    return dict(zip(_CONTAINER_KEYS, [plug.getValue() for plug in plugs]))
+
 
 def imprint(node: Gaffer.Node,
             data: dict,
@@ -276,21 +435,31 @@ def imprint(node: Gaffer.Node,
 
     """
 
-    FLAGS = Gaffer.Plug.Flags.Default | Gaffer.Plug.Flags.Dynamic
-
+    user = node["user"]
+    new_plugs = []
     for key, value in data.items():
         # Dict to JSON
         if isinstance(value, dict):
-            value = json.dumps(value)
+            value = json.dumps(
+                value, separators=_JSON_SEPARATORS, ensure_ascii=False)
             value = f"{JSON_PREFIX}{value}"
 
-        if key in node["user"]:
-            # Set existing attribute
+        existing_plug = user[key] if key in user else None
+        if value is None:
+            # An existing plug is cleared, a new plug gets a placeholder
+            value = "" if existing_plug is not None else "<None>"
+
+        plug_type = _get_plug_type(value)
+        if existing_plug is not None:
+            if type(existing_plug) is plug_type:
+                # Set existing attribute
+                existing_plug.setValue(value)
+                continue
+
             try:
-                if value is None:
-                    value = ""
-                log.warning(value)
-                node["user"][key].setValue(value)
+                # The plug may still accept the value, e.g. an `int` on a
+                # `FloatPlug`, in which case we keep the plug as is
+                existing_plug.setValue(value)
                 continue
             except Exception:
                 # If an exception occurs then we'll just replace the key
@@ -300,29 +469,37 @@ def imprint(node: Gaffer.Node,
                             "Plug will be replaced.",
                             node.getName(), key, value, type(value),
                             exc_info=sys.exc_info())
-                pass
-
-        if value is None:
-            value = "<None>"
 
-        # Generate new plug with value as default value
-        if isinstance(value, str):
-            plug = Gaffer.StringPlug(key, defaultValue=value, flags=FLAGS)
-        elif isinstance(value, bool):
-            plug = Gaffer.BoolPlug(key, defaultValue=value, flags=FLAGS)
-        elif isinstance(value, float):
-            plug = Gaffer.FloatPlug(key, defaultValue=value, flags=FLAGS)
-        elif isinstance(value, int):
-            plug = Gaffer.IntPlug(key, defaultValue=value, flags=FLAGS)
-        else:
+        if plug_type is None:
             raise TypeError(
                 f"Unsupported value type: {type(value)} -> {value}"
             )
 
-        if section:
+        # Generate new plug with value as default value
+        plug = plug_type(
+            key,
+            defaultValue=value,
+            flags=ayon_gaffer.api.lib.DYNAMIC_PLUG_FLAGS
+        )
+        user[key] = plug
+        new_plugs.append(plug)
+
+    if section:
+        for plug in new_plugs:
             Gaffer.Metadata.registerValue(plug, "layout:section", section)
 
-        node["user"][key] = plug
+
+def _get_plug_type(value) -> Optional[type]:
+    """Return the Gaffer plug type to store `value` in, if supported."""
+    plug_type = _PLUG_TYPES.get(type(value))
+    if plug_type is not None:
+        return plug_type
+
+    # Subclasses of the supported types, e.g. `str` enums
+    for value_type, plug_type in _PLUG_TYPES.items():
+        if isinstance(value, value_type):
+            return plug_type
+    return None
 
 
 def get_context_label():
@@ -7,7 +7,11 @@ from ayon_core.pipeline import (
 from ayon_core.lib import filter_profiles
 
 from ayon_gaffer.api import get_root, imprint_container
-import ayon_gaffer.api.lib
+from ayon_gaffer.api.lib import (
+    make_scene_load_box,
+    node_name_from_template,
+    to_forward_slashes
+)
 import ayon_gaffer.api.plugin
 
 import GafferScene
@@ -89,7 +93,7 @@ class GafferLoadScene(ayon_gaffer.api.plugin.GafferLoaderBase):
             sg_location_template = (selected_profile
                                     ["scenegraph_location_template"])
             aux_transforms = selected_profile["auxiliary_transforms"]
-            node = ayon_gaffer.api.lib.make_scene_load_box(
+            node = make_scene_load_box(
                 script,
                 resolved_node_name,
                 sg_location_template,
@@ -101,7 +105,7 @@ class GafferLoadScene(ayon_gaffer.api.plugin.GafferLoaderBase):
                 self.simple_loading["node_name_template"], context)
             node.setName(node_name)
 
-        path = self.filepath_from_context(context).replace("\\", "/")
+        path = to_forward_slashes(self.filepath_from_context(context))
         node["fileName"].setValue(path)
         script.addChild(node)
 
@@ -119,7 +123,7 @@ class GafferLoadScene(ayon_gaffer.api.plugin.GafferLoaderBase):
     def update(self, container, context):
         representation = context["representation"]
         path = get_representation_path(representation)
-        path = path.replace("\\", "/")
+        path = to_forward_slashes(path)
 
         node = container["_node"]
         node["fileName"].setValue(path)
@@ -134,5 +138,4 @@ class GafferLoadScene(ayon_gaffer.api.plugin.GafferLoaderBase):
         parent.removeChild(node)
 
     def _get_node_name(self, node_name, context):
-        return ayon_gaffer.api.lib.node_name_from_template(
-            node_name, context)
+        return node_name_from_template(node_name, context)